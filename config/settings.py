@@ -2,10 +2,11 @@
 Configuración centralizada para EOM Scraper
 """
 import os
+from functools import lru_cache
 from dataclasses import dataclass
 from typing import Optional
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class EmailConfig:
     """Configuración para envío de emails a Readwise"""
     smtp_server: str
@@ -16,19 +17,20 @@ class EmailConfig:
     from_email: str
     from_name: str = "EOM Scraper"
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class EOMConfig:
     """Configuración para El Orden Mundial"""
     base_url: str = "https://elordenmundial.com"
     api_base: str = "/wp-json/wp/v2"
     max_per_page: int = 100
+    max_concurrent_requests: int = 4  # páginas pedidas en paralelo
     
     # Credenciales para contenido premium (futuro)
     username: Optional[str] = None
     password: Optional[str] = None
     enable_premium: bool = False
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AppConfig:
     """Configuración general de la aplicación"""
     state_file: str = "eom_state.json"
@@ -41,9 +43,20 @@ class AppConfig:
     
     # Rate limiting
     request_delay: float = 1.0  # segundos entre requests
+    
+    # Envío de emails
+    email_workers: int = 4  # conexiones SMTP en paralelo
+    send_delay: float = 2.0  # segundos entre envíos de una misma conexión
+    max_run_seconds: float = 300.0  # tiempo máximo de envío por ejecución
 
+@lru_cache(maxsize=1)
 def load_config() -> tuple[EmailConfig, EOMConfig, AppConfig]:
-    """Carga configuración desde variables de entorno"""
+    """
+    Carga configuración desde variables de entorno
+    
+    El resultado se cachea para todo el proceso; usar load_config.cache_clear()
+    para volver a leer el entorno.
+    """
     
     email_config = EmailConfig(
         smtp_server=os.getenv('SMTP_SERVER', 'smtp.gmail.com'),
@@ -66,7 +79,10 @@ def load_config() -> tuple[EmailConfig, EOMConfig, AppConfig]:
         log_level=os.getenv('LOG_LEVEL', 'INFO'),
         dry_run=os.getenv('DRY_RUN', 'false').lower() == 'true',
         process_premium_content=eom_config.enable_premium,
-        request_delay=float(os.getenv('REQUEST_DELAY', '1.0'))
+        request_delay=float(os.getenv('REQUEST_DELAY', '1.0')),
+        email_workers=int(os.getenv('EMAIL_WORKERS', '4')),
+        send_delay=float(os.getenv('SEND_DELAY', '2.0')),
+        max_run_seconds=float(os.getenv('MAX_RUN_SECONDS', '300'))
     )
     
     return email_config, eom_config, app_config
@@ -2,42 +2,105 @@
 Cliente para WordPress REST API de El Orden Mundial
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+import math
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from typing import List, Dict, Optional, Any
+from urllib.parse import urlencode
 from config.settings import EOMConfig
+from utils.helpers import PREMIUM_MARKER
 
 logger = logging.getLogger(__name__)
 
+# Valor por defecto compartido para subdiccionarios ausentes (solo lectura)
+_EMPTY: Dict[str, Any] = {}
+
 class EOMAPIClient:
     """Cliente para interactuar con la API REST de El Orden Mundial"""
     
     def __init__(self, config: EOMConfig, request_delay: float = 1.0):
         self.config = config
-        self.session = requests.Session()
         self.request_delay = request_delay
         self.authenticated = False
         
-        # Headers por defecto
-        self.session.headers.update({
-            'User-Agent': 'EOM-Scraper/1.0',
-            'Accept': 'application/json'
-        })
+        # Rate limiting compartido entre hilos (paginación concurrente)
+        self._rate_lock = threading.Lock()
+        self._next_request_at = 0.0
+        
+        # ETags por endpoint ({'query': ..., 'etag': ...}); el llamador puede persistirlos
+        self.etags: Dict[str, Dict[str, str]] = {}
+        
+        # La sesión HTTP se crea en la primera petición
+        self._session: Optional[requests.Session] = None
     
-    def _make_request(self, endpoint: str, params: Dict[str, Any] = None) -> Optional[Dict]:
-        """Realiza una petición con rate limiting y manejo de errores"""
+    @property
+    def session(self) -> requests.Session:
+        """Sesión HTTP compartida, creada bajo demanda"""
+        if self._session is None:
+            session = requests.Session()
+            
+            # Pool de conexiones keep-alive y reintentos con backoff ante errores transitorios
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=max(10, self.config.max_concurrent_requests),
+                max_retries=Retry(
+                    total=3,
+                    backoff_factor=0.3,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset(['GET'])
+                )
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            
+            # Headers por defecto
+            session.headers.update({
+                'User-Agent': 'EOM-Scraper/1.0',
+                'Accept': 'application/json'
+            })
+            self._session = session
+        return self._session
+    
+    @session.setter
+    def session(self, session: requests.Session) -> None:
+        self._session = session
+    
+    def close(self) -> None:
+        """Cierra la sesión HTTP y sus conexiones abiertas"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+    
+    def _wait_rate_limit(self) -> None:
+        """Reserva el siguiente hueco de request_delay y espera hasta él"""
+        with self._rate_lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_request_at)
+            self._next_request_at = start_at + self.request_delay
+        
+        if start_at > now:
+            time.sleep(start_at - now)
+    
+    def _get(self, endpoint: str, params: Dict[str, Any] = None,
+             etag: Optional[str] = None) -> Optional[requests.Response]:
+        """Realiza una petición GET con rate limiting y manejo de errores"""
         url = f"{self.config.base_url}{self.config.api_base}{endpoint}"
         
+        # Rate limiting: se espera antes de cada petición, no después de la última
+        self._wait_rate_limit()
+        
         try:
             logger.debug(f"Realizando petición: {url} con params: {params}")
-            response = self.session.get(url, params=params, timeout=30)
+            headers = {'If-None-Match': etag} if etag else None
+            response = self.session.get(url, params=params, headers=headers, timeout=30)
             
-            # Rate limiting
-            time.sleep(self.request_delay)
-            
-            if response.status_code == 200:
-                return response.json()
+            if response.status_code == 200 or (etag and response.status_code == 304):
+                return response
             else:
                 logger.error(f"Error en petición: {response.status_code} - {response.text}")
                 return None
@@ -46,6 +109,76 @@ class EOMAPIClient:
             logger.error(f"Error en petición HTTP: {e}")
             return None
     
+    def _make_request(self, endpoint: str, params: Dict[str, Any] = None) -> Optional[Dict]:
+        """Realiza una petición y devuelve el JSON de la respuesta"""
+        response = self._get(endpoint, params)
+        if response is None:
+            return None
+        
+        try:
+            return response.json()
+        except ValueError as e:
+            logger.error(f"Respuesta JSON inválida: {e}")
+            return None
+    
+    def _get_paginated(self, endpoint: str, params: Dict[str, Any], limit: int) -> List[Dict]:
+        """
+        Obtiene hasta `limit` elementos de un endpoint paginado.
+        
+        La primera página indica el total (X-WP-TotalPages); el resto se
+        piden en paralelo, respetando el rate limiting.
+        """
+        per_page = min(limit, self.config.max_per_page)
+        params = dict(params, per_page=per_page, page=1)
+        
+        response = self._get(endpoint, params)
+        if response is None:
+            return []
+        
+        try:
+            items = response.json()
+            total_pages = int(response.headers.get('X-WP-TotalPages', 1))
+        except ValueError as e:
+            logger.error(f"Respuesta de paginación inválida: {e}")
+            return []
+        
+        if len(items) == per_page:
+            remaining = self._get_remaining_pages(endpoint, params, total_pages, limit)
+            if remaining is None:
+                logger.warning("Algunas páginas no se pudieron obtener; resultado incompleto")
+            else:
+                items.extend(remaining)
+        
+        return items[:limit]
+    
+    def _get_remaining_pages(self, endpoint: str, params: Dict[str, Any],
+                             total_pages: int, limit: int) -> Optional[List[Dict]]:
+        """
+        Pide en paralelo las páginas 2..N necesarias para llegar a `limit`
+        
+        Devuelve None si alguna página falla, para que el llamador no tome
+        un resultado incompleto por completo.
+        """
+        pages_needed = min(total_pages, math.ceil(limit / params['per_page']))
+        if pages_needed < 2:
+            return []
+        
+        items = []
+        failed = False
+        workers = min(self.config.max_concurrent_requests, pages_needed - 1)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            pages = executor.map(
+                lambda page: self._make_request(endpoint, dict(params, page=page)),
+                range(2, pages_needed + 1)
+            )
+            for page_items in pages:
+                if page_items is None:
+                    failed = True
+                    continue
+                items.extend(page_items)
+        
+        return None if failed else items
+    
     def authenticate(self) -> bool:
         """Autenticación para contenido premium (implementación futura)"""
         if not self.config.username or not self.config.password:
@@ -58,13 +191,21 @@ class EOMAPIClient:
         logger.info("Autenticación deshabilitada en esta versión")
         return False
     
-    def get_posts_since(self, since_datetime: datetime, max_posts: int = 100) -> List[Dict]:
-        """Obtiene posts publicados desde una fecha específica"""
+    def get_posts_since(self, since_datetime: datetime, max_posts: int = 500) -> Optional[List[Dict]]:
+        """
+        Obtiene posts publicados desde una fecha específica
+        
+        Devuelve [] si no hay posts nuevos (o el servidor responde 304) y None si
+        falla cualquier petición: el llamador no debe tomar un error de la API o
+        una consulta incompleta por una ejecución sin posts.
+        """
         since_iso = since_datetime.isoformat()
+        per_page = min(max_posts, self.config.max_per_page)
         
         params = {
             'after': since_iso,
-            'per_page': min(max_posts, self.config.max_per_page),
+            'per_page': per_page,
+            'page': 1,
             'orderby': 'date',
             'order': 'desc',
             'status': 'publish'
@@ -72,69 +213,93 @@ class EOMAPIClient:
         
         logger.info(f"Buscando posts desde: {since_iso}")
         
-        posts = self._make_request('/posts', params)
-        if posts is None:
+        # Reutilizar el ETag solo si la consulta es idéntica a la anterior
+        query = urlencode(sorted(params.items()))
+        cached = self.etags.get('/posts')
+        etag = cached['etag'] if cached and cached.get('query') == query else None
+        
+        response = self._get('/posts', params, etag=etag)
+        if response is None:
+            return None
+        
+        if response.status_code == 304:
+            logger.info("Sin cambios desde la última consulta")
             return []
         
+        try:
+            posts = response.json()
+            total_pages = int(response.headers.get('X-WP-TotalPages', 1))
+        except ValueError as e:
+            logger.error(f"Respuesta JSON inválida: {e}")
+            return None
+        
+        # Tras un periodo sin ejecutar puede haber más de una página: el resto se piden en paralelo
+        if len(posts) == per_page:
+            remaining = self._get_remaining_pages('/posts', params, total_pages, max_posts)
+            if remaining is None:
+                # Sin guardar el ETag: la próxima ejecución debe repetir la consulta
+                logger.error("No se pudieron obtener todas las páginas de posts")
+                return None
+            posts.extend(remaining)
+            
+            # Un post publicado durante la paginación desplaza los demás y puede repetirse
+            unique_posts = {}
+            for post in posts:
+                unique_posts.setdefault(post.get('id'), post)
+            posts = list(unique_posts.values())[:max_posts]
+        
+        new_etag = response.headers.get('ETag')
+        if new_etag:
+            self.etags['/posts'] = {'query': query, 'etag': new_etag}
+        
         logger.info(f"Encontrados {len(posts)} posts nuevos")
         return posts
     
     def get_all_recent_posts(self, limit: int = 50) -> List[Dict]:
         """Obtiene los posts más recientes (para inicialización)"""
-        all_posts = []
-        page = 1
+        params = {
+            'orderby': 'date',
+            'order': 'desc',
+            'status': 'publish'
+        }
         
-        while len(all_posts) < limit:
-            remaining = limit - len(all_posts)
-            per_page = min(remaining, self.config.max_per_page)
-            
-            params = {
-                'per_page': per_page,
-                'page': page,
-                'orderby': 'date',
-                'order': 'desc',
-                'status': 'publish'
-            }
-            
-            posts = self._make_request('/posts', params)
-            if not posts:
-                break
-            
-            all_posts.extend(posts)
-            page += 1
-            
-            # Si obtenemos menos posts de los solicitados, no hay más páginas
-            if len(posts) < per_page:
-                break
+        all_posts = self._get_paginated('/posts', params, limit)
         
         logger.info(f"Obtenidos {len(all_posts)} posts recientes")
-        return all_posts[:limit]
+        return all_posts
     
     def classify_post_access(self, post_data: Dict) -> str:
         """Clasifica si un post es abierto o premium"""
-        content = post_data.get('content', {}).get('rendered', '')
-        
-        if 'mepr-unauthorized-excerpt' in content:
+        content = (post_data.get('content') or _EMPTY).get('rendered', '')
+        return self._classify_content(content)
+    
+    @staticmethod
+    def _classify_content(content: str) -> str:
+        """Clasifica a partir del HTML del contenido ya extraído"""
+        if PREMIUM_MARKER in content:
             return 'premium'
         else:
             return 'open'
     
     def extract_post_metadata(self, post_data: Dict) -> Dict[str, Any]:
         """Extrae metadatos útiles de un post"""
+        get = post_data.get
+        content = (get('content') or _EMPTY).get('rendered', '')
+        
         return {
-            'id': post_data.get('id'),
-            'title': post_data.get('title', {}).get('rendered', ''),
-            'excerpt': post_data.get('excerpt', {}).get('rendered', ''),
-            'url': post_data.get('link', ''),
-            'date': post_data.get('date', ''),
-            'modified': post_data.get('modified', ''),
-            'author_id': post_data.get('author'),
-            'categories': post_data.get('categories', []),
-            'tags': post_data.get('tags', []),
-            'places': post_data.get('lugar', []),  # Taxonomía personalizada
-            'coauthors': post_data.get('coauthors', []),
-            'content_raw': post_data.get('content', {}).get('rendered', ''),
-            'access_type': self.classify_post_access(post_data)
+            'id': get('id'),
+            'title': (get('title') or _EMPTY).get('rendered', ''),
+            'excerpt': (get('excerpt') or _EMPTY).get('rendered', ''),
+            'url': get('link', ''),
+            'date': get('date', ''),
+            'modified': get('modified', ''),
+            'author_id': get('author'),
+            'categories': get('categories', []),
+            'tags': get('tags', []),
+            'places': get('lugar', []),  # Taxonomía personalizada
+            'coauthors': get('coauthors', []),
+            'content_raw': content,
+            'access_type': self._classify_content(content)
         }
     
     def get_post_by_id(self, post_id: int) -> Optional[Dict]:
@@ -2,18 +2,141 @@
 Procesador de contenido para artículos de EOM
 """
 import re
+import sys
 import logging
-from typing import Dict, List, Any, Optional
-from bs4 import BeautifulSoup
+from functools import lru_cache
+from html import escape, unescape
+from string import Template
+from typing import Dict, List, Any, Optional, Tuple, TYPE_CHECKING
 from datetime import datetime
+from utils.helpers import SOUP_PARSER, PREMIUM_MARKER, get_beautifulsoup, soup_fragment_html
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
 
 logger = logging.getLogger(__name__)
 
+_WS_RE = re.compile(r'\s+')
+
+# Recorte rápido del div de excerpt premium sin construir el árbol completo
+_EXCERPT_RE = re.compile(
+    r'<div\b[^>]*\bclass=["\'][^"\']*' + re.escape(PREMIUM_MARKER) + r'[^"\']*["\'][^>]*>(.*?)</div>',
+    re.DOTALL | re.IGNORECASE
+)
+_TAG_RE = re.compile(r'<[^>]+>')
+
+# Contenedores del paywall que se eliminan del contenido
+_PAYWALL_CLASSES = frozenset(('mp_wrapper', 'payment-wall', 'mepr-login-form-wrap'))
+
+# Atributos que se conservan al limpiar el HTML
+_ALLOWED_ATTRS = frozenset(('href', 'src', 'alt', 'title', 'class'))
+
+# Elementos que se conservan en el HTML limpio pero no cuentan como texto
+_NON_TEXT_TAGS = frozenset(('style', 'nav', 'footer'))
+
+# Plantillas de email: se compilan una vez al importar el módulo.
+# $content es HTML ya limpio; el resto de campos se escapan al sustituir
+_FULL_ARTICLE_TEMPLATE = Template("""
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <title>$title</title>
+        </head>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; max-width: 800px; margin: 0 auto;">
+            <header style="border-bottom: 2px solid #e0e0e0; padding-bottom: 20px; margin-bottom: 30px;">
+                <h1 style="color: #333; margin-bottom: 10px;">$title</h1>
+                <p style="color: #666; margin: 0;">
+                    <strong>Fecha:</strong> $date | 
+                    <strong>Tiempo de lectura:</strong> $read_time min | 
+                    <strong>Fuente:</strong> <a href="$url">El Orden Mundial</a>
+                </p>
+            </header>
+            
+            <main>
+                $content
+            </main>
+            
+            <footer style="border-top: 1px solid #e0e0e0; padding-top: 20px; margin-top: 40px;">
+                <p style="color: #888; font-size: 14px;">
+                    Artículo original: <a href="$url">$url</a><br>
+                    Enviado automáticamente por EOM Scraper
+                </p>
+            </footer>
+        </body>
+        </html>
+        """)
+
+_PREVIEW_TEMPLATE = Template("""
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <title>$title</title>
+        </head>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; max-width: 800px; margin: 0 auto;">
+            <header style="border-bottom: 2px solid #e0e0e0; padding-bottom: 20px; margin-bottom: 30px;">
+                <h1 style="color: #333; margin-bottom: 10px;">$title</h1>
+                <p style="color: #666; margin: 0;">
+                    <strong>Fecha:</strong> $date | 
+                    <strong>Tipo:</strong> Artículo premium | 
+                    <strong>Fuente:</strong> <a href="$url">El Orden Mundial</a>
+                </p>
+            </header>
+            
+            <main>
+                <div style="background-color: #f8f9fa; padding: 20px; border-left: 4px solid #007cba; margin-bottom: 20px;">
+                    <h3 style="color: #007cba; margin-top: 0;">Vista previa</h3>
+                    <p>$excerpt</p>
+                </div>
+                
+                <div style="text-align: center; padding: 20px; background-color: #fff3cd; border: 1px solid #ffeaa7; border-radius: 5px;">
+                    <p style="margin: 0; color: #856404;">
+                        <strong>Artículo completo disponible con suscripción</strong><br>
+                        <a href="$url" style="color: #007cba; text-decoration: none; font-weight: bold;">Leer artículo completo →</a>
+                    </p>
+                </div>
+            </main>
+            
+            <footer style="border-top: 1px solid #e0e0e0; padding-top: 20px; margin-top: 40px;">
+                <p style="color: #888; font-size: 14px;">
+                    Artículo original: <a href="$url">$url</a><br>
+                    Enviado automáticamente por EOM Scraper
+                </p>
+            </footer>
+        </body>
+        </html>
+        """)
+
+@lru_cache(maxsize=1024)
+def _format_wp_date(date_str: str) -> str:
+    """Formatea una fecha de WordPress; muchos artículos de un lote comparten fecha"""
+    try:
+        # Formato de fecha de WordPress: "2025-06-19T07:00:00"
+        # Desde Python 3.11 fromisoformat acepta el sufijo 'Z'
+        iso_str = date_str if sys.version_info >= (3, 11) else date_str.replace('Z', '+00:00')
+        dt = datetime.fromisoformat(iso_str)
+        return dt.strftime("%d/%m/%Y %H:%M")
+    except ValueError:
+        logger.warning(f"Formato de fecha no reconocido: {date_str}")
+        return date_str
+
+def _is_removable(tag) -> bool:
+    """Scripts y contenedores del paywall"""
+    if tag.name == 'script':
+        return True
+    if tag.name == 'div':
+        classes = tag.get('class')
+        return bool(classes) and not _PAYWALL_CLASSES.isdisjoint(classes)
+    return False
+
 class ContentProcessor:
     """Procesador de contenido de artículos"""
     
-    def __init__(self):
-        self.soup_parser = 'html.parser'
+    def __init__(self, soup_parser: str = SOUP_PARSER):
+        self.soup_parser = soup_parser
+    
+    def _parse(self, markup: str) -> 'BeautifulSoup':
+        """Parsea HTML (bs4 se importa solo cuando hace falta)"""
+        return get_beautifulsoup()(markup, self.soup_parser)
     
     def process_article(self, post_metadata: Dict[str, Any]) -> Dict[str, Any]:
         """Procesa un artículo completo"""
@@ -37,16 +160,18 @@ class ContentProcessor:
     
     def _process_open_content(self, post_metadata: Dict[str, Any]) -> Dict[str, Any]:
         """Procesa contenido abierto completo"""
-        content_html = post_metadata['content_raw']
+        # Parsear una sola vez y compartir el árbol entre los pasos.
+        # El orden importa: primero las lecturas, después las pasadas destructivas
+        soup = self._parse(post_metadata['content_raw'])
         
-        # Limpiar HTML
-        cleaned_content = self._clean_html_content(content_html)
+        # Extraer imágenes
+        images = self._extract_images(soup)
         
-        # Extraer texto plano para preview
-        text_content = self._extract_text_content(content_html)
+        # Limpiar HTML
+        cleaned_content = self._clean_html_content(soup)
         
-        # Extraer imágenes
-        images = self._extract_images(content_html)
+        # Extraer texto plano para preview del árbol ya limpio, sin otra pasada
+        text_content = self._soup_text(soup)
         
         return {
             'content_html': cleaned_content,
@@ -62,15 +187,13 @@ class ContentProcessor:
         excerpt_html = post_metadata['content_raw']
         
         # Extraer solo el excerpt del paywall
-        soup = BeautifulSoup(excerpt_html, self.soup_parser)
-        excerpt_div = soup.find('div', class_='mepr-unauthorized-excerpt')
+        premium_excerpt = self._find_premium_excerpt(excerpt_html)
         
-        if excerpt_div:
-            excerpt_content = str(excerpt_div)
-            text_content = excerpt_div.get_text(strip=True)
+        if premium_excerpt:
+            excerpt_content, text_content = premium_excerpt
         else:
             excerpt_content = post_metadata['excerpt']
-            text_content = self._extract_text_content(post_metadata['excerpt'])
+            text_content = self._extract_text_content(self._parse(post_metadata['excerpt']))
         
         return {
             'content_html': excerpt_content,
@@ -82,50 +205,63 @@ class ContentProcessor:
             'requires_subscription': True
         }
     
-    def _clean_html_content(self, html_content: str) -> str:
-        """Limpia el contenido HTML"""
-        if not html_content:
-            return ""
+    def _find_premium_excerpt(self, html_content: str) -> Optional[Tuple[str, str]]:
+        """Localiza el div de excerpt premium y devuelve (html, texto)"""
+        if not html_content or PREMIUM_MARKER not in html_content:
+            return None
+        
+        # Camino rápido: regex, válida solo si el div no contiene otros divs
+        match = _EXCERPT_RE.search(html_content)
+        if match and '<div' not in match.group(1).lower():
+            text = ''.join(unescape(part).strip() for part in _TAG_RE.split(match.group(1)))
+            return match.group(0), text
+        
+        soup = self._parse(html_content)
+        excerpt_div = soup.find('div', class_=PREMIUM_MARKER)
+        if excerpt_div:
+            return str(excerpt_div), excerpt_div.get_text(strip=True)
         
-        soup = BeautifulSoup(html_content, self.soup_parser)
+        return None
+    
+    def _clean_html_content(self, soup: 'BeautifulSoup') -> str:
+        """
+        Limpia el contenido HTML (modifica el árbol recibido)
         
-        # Remover elementos de paywall
-        for element in soup.find_all('div', class_=['mp_wrapper', 'payment-wall', 'mepr-login-form-wrap']):
+        Tras serializar elimina también los elementos sin texto útil (style,
+        nav, footer), de modo que el árbol queda listo para _soup_text.
+        """
+        # Remover elementos de paywall y scripts en una sola pasada
+        for element in soup.find_all(_is_removable):
             element.decompose()
         
-        # Remover scripts
-        for script in soup.find_all('script'):
-            script.decompose()
+        # Limpiar atributos innecesarios (incluidos estilos inline) pero mantener estructura
+        non_text = []
+        for element in soup.find_all(True):
+            element.attrs = {k: v for k, v in element.attrs.items() if k in _ALLOWED_ATTRS}
+            if element.name in _NON_TEXT_TAGS:
+                non_text.append(element)
         
-        # Remover estilos inline excesivos
-        for element in soup.find_all(style=True):
-            del element['style']
+        cleaned = soup_fragment_html(soup)
         
-        # Limpiar atributos innecesarios pero mantener estructura
-        allowed_attrs = ['href', 'src', 'alt', 'title', 'class']
-        for element in soup.find_all():
-            attrs_to_remove = [attr for attr in element.attrs if attr not in allowed_attrs]
-            for attr in attrs_to_remove:
-                del element[attr]
+        for element in non_text:
+            element.decompose()
         
-        return str(soup)
+        return cleaned
     
-    def _extract_text_content(self, html_content: str) -> str:
-        """Extrae texto plano del HTML"""
-        if not html_content:
-            return ""
-        
-        soup = BeautifulSoup(html_content, self.soup_parser)
-        
+    def _extract_text_content(self, soup: 'BeautifulSoup') -> str:
+        """Extrae texto plano del HTML (modifica el árbol recibido)"""
         # Remover elementos no deseados
         for element in soup.find_all(['script', 'style', 'nav', 'footer']):
             element.decompose()
         
-        # Obtener texto y limpiar
+        return self._soup_text(soup)
+    
+    def _soup_text(self, soup: 'BeautifulSoup') -> str:
+        """Texto plano de un árbol ya limpio"""
         text = soup.get_text(separator=' ', strip=True)
         
         # Limpiar espacios múltiples
-        text = re.sub(r'\s+', ' ', text)
+        text = _WS_RE.sub(' ', text)
         
         return text.strip()
     
@@ -134,8 +270,12 @@ class ContentProcessor:
         if not title:
             return ""
         
+        # Sin etiquetas no hace falta parsear: basta con resolver las entidades
+        if '<' not in title:
+            return unescape(title).strip()
+        
         # Remover HTML si lo hay
-        soup = BeautifulSoup(title, self.soup_parser)
+        soup = self._parse(title)
         clean_title = soup.get_text(strip=True)
         
         return clean_title
@@ -145,20 +285,18 @@ class ContentProcessor:
         if not excerpt:
             return ""
         
-        soup = BeautifulSoup(excerpt, self.soup_parser)
+        if '<' not in excerpt:
+            return unescape(excerpt).strip()
+        
+        soup = self._parse(excerpt)
         clean_excerpt = soup.get_text(strip=True)
         
         return clean_excerpt
     
-    def _extract_images(self, html_content: str) -> List[Dict[str, str]]:
+    def _extract_images(self, soup: 'BeautifulSoup') -> List[Dict[str, str]]:
         """Extrae información de imágenes del contenido"""
         images = []
         
-        if not html_content:
-            return images
-        
-        soup = BeautifulSoup(html_content, self.soup_parser)
-        
         for img in soup.find_all('img'):
             src = img.get('src', '')
             alt = img.get('alt', '')
@@ -177,13 +315,7 @@ class ContentProcessor:
         if not date_str:
             return ""
         
-        try:
-            # Formato de fecha de WordPress: "2025-06-19T07:00:00"
-            dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-            return dt.strftime("%d/%m/%Y %H:%M")
-        except ValueError:
-            logger.warning(f"Formato de fecha no reconocido: {date_str}")
-            return date_str
+        return _format_wp_date(date_str)
     
     def _estimate_read_time(self, text_content: str, wpm: int = 200) -> int:
         """Estima tiempo de lectura en minutos"""
@@ -226,75 +358,20 @@ class ContentProcessor:
     def _create_full_article_email(self, title: str, url: str, date: str, 
                                  content: str, read_time: int) -> str:
         """Crea email con artículo completo"""
-        return f"""
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <title>{title}</title>
-        </head>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; max-width: 800px; margin: 0 auto;">
-            <header style="border-bottom: 2px solid #e0e0e0; padding-bottom: 20px; margin-bottom: 30px;">
-                <h1 style="color: #333; margin-bottom: 10px;">{title}</h1>
-                <p style="color: #666; margin: 0;">
-                    <strong>Fecha:</strong> {date} | 
-                    <strong>Tiempo de lectura:</strong> {read_time} min | 
-                    <strong>Fuente:</strong> <a href="{url}">El Orden Mundial</a>
-                </p>
-            </header>
-            
-            <main>
-                <div style="background-color: #f8f9fa; padding: 20px; border-left: 4px solid #007cba; margin-bottom: 20px;">
-                    <h3 style="color: #007cba; margin-top: 0;">Vista previa</h3>
-                    <p>{excerpt}</p>
-                </div>
-                
-                <div style="text-align: center; padding: 20px; background-color: #fff3cd; border: 1px solid #ffeaa7; border-radius: 5px;">
-                    <p style="margin: 0; color: #856404;">
-                        <strong>Artículo completo disponible con suscripción</strong><br>
-                        <a href="{url}" style="color: #007cba; text-decoration: none; font-weight: bold;">Leer artículo completo →</a>
-                    </p>
-                </div>
-            </main>
-            
-            <footer style="border-top: 1px solid #e0e0e0; padding-top: 20px; margin-top: 40px;">
-                <p style="color: #888; font-size: 14px;">
-                    Artículo original: <a href="{url}">{url}</a><br>
-                    Enviado automáticamente por EOM Scraper
-                </p>
-            </footer>
-        </body>
-        </html>
-        """El Orden Mundial</a>
-                </p>
-            </header>
-            
-            <main>
-                {content}
-            </main>
-            
-            <footer style="border-top: 1px solid #e0e0e0; padding-top: 20px; margin-top: 40px;">
-                <p style="color: #888; font-size: 14px;">
-                    Artículo original: <a href="{url}">{url}</a><br>
-                    Enviado automáticamente por EOM Scraper
-                </p>
-            </footer>
-        </body>
-        </html>
-        """
+        return _FULL_ARTICLE_TEMPLATE.substitute(
+            title=escape(title),
+            url=escape(url),
+            date=escape(date),
+            read_time=read_time,
+            content=content
+        )
     
     def _create_preview_email(self, title: str, url: str, date: str, 
                             excerpt: str, read_time: int) -> str:
         """Crea email con preview del artículo premium"""
-        return f"""
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <title>{title}</title>
-        </head>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; max-width: 800px; margin: 0 auto;">
-            <header style="border-bottom: 2px solid #e0e0e0; padding-bottom: 20px; margin-bottom: 30px;">
-                <h1 style="color: #333; margin-bottom: 10px;">{title}</h1>
-                <p style="color: #666; margin: 0;">
-                    <strong>Fecha:</strong> {date} | 
-                    <strong>Tipo:</strong> Artículo premium | 
-                    <strong>Fuente:</strong> <a href="{url}">
\ No newline at end of file
+        return _PREVIEW_TEMPLATE.substitute(
+            title=escape(title),
+            url=escape(url),
+            date=escape(date),
+            excerpt=escape(excerpt)
+        )
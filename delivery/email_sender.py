@@ -1,22 +1,123 @@
 """
 Envío de emails a Readwise
 """
-import smtplib
+import base64
 import logging
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.utils import formataddr
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, TYPE_CHECKING
 from config.settings import EmailConfig
 
+# smtplib y email.* solo se importan en los caminos que envían de verdad,
+# para que --dry-run no pague su coste de importación
+if TYPE_CHECKING:
+    import smtplib
+
 logger = logging.getLogger(__name__)
 
+# Cabeceras del email: un único cuerpo HTML en base64, sin construir objetos MIME
+_EMAIL_HEADERS_TEMPLATE = (
+    "From: {from_}\r\n"
+    "To: {to}\r\n"
+    "Subject: {subject}\r\n"
+    "MIME-Version: 1.0\r\n"
+    "Content-Type: text/html; charset=utf-8\r\n"
+    "Content-Transfer-Encoding: base64\r\n"
+    "X-Readwise-Source: eom-scraper\r\n"
+    "X-Article-URL: {url}\r\n"
+    "X-Article-ID: {aid}\r\n"
+    "\r\n"
+)
+
+def _encode_header(value: str) -> str:
+    """Codifica un valor de cabecera (RFC 2047 solo si no es ASCII)"""
+    # Sin saltos de línea: evita inyección de cabeceras
+    value = ' '.join(value.split())
+    if value.isascii():
+        return value
+    
+    from email.header import Header
+    return Header(value, 'utf-8').encode(linesep='\r\n')
+
 class EmailSender:
     """Enviador de emails para integración con Readwise"""
     
-    def __init__(self, config: EmailConfig, dry_run: bool = False):
+    def __init__(self, config: EmailConfig, dry_run: bool = False, timeout: float = 60.0):
         self.config = config
         self.dry_run = dry_run
+        # Timeout de socket por operación SMTP: un servidor colgado no bloquea el envío
+        self.timeout = timeout
+        
+        # Pool de conexiones autenticadas libres: cada envío toma una y la devuelve,
+        # así los envíos en paralelo nunca comparten sesión SMTP
+        self._idle_servers = []
+        self._servers_lock = threading.Lock()
+    
+    def __enter__(self) -> 'EmailSender':
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+    
+    def _connect(self) -> 'smtplib.SMTP':
+        """Abre una conexión SMTP autenticada"""
+        import smtplib
+        
+        if self.config.smtp_port == 465:
+            # SSL
+            server = smtplib.SMTP_SSL(self.config.smtp_server, self.config.smtp_port,
+                                      timeout=self.timeout)
+        else:
+            # TLS
+            server = smtplib.SMTP(self.config.smtp_server, self.config.smtp_port,
+                                  timeout=self.timeout)
+            server.starttls()
+        
+        # Autenticación
+        server.login(self.config.smtp_username, self.config.smtp_password)
+        return server
+    
+    def _acquire_server(self) -> 'smtplib.SMTP':
+        """Toma una conexión libre del pool o abre una nueva"""
+        with self._servers_lock:
+            if self._idle_servers:
+                return self._idle_servers.pop()
+        return self._connect()
+    
+    def _release_server(self, server: 'smtplib.SMTP') -> None:
+        """Devuelve una conexión válida al pool para reutilizarla"""
+        with self._servers_lock:
+            self._idle_servers.append(server)
+    
+    @staticmethod
+    def _connection_lost(error: Exception) -> bool:
+        """Indica si el servidor cerró la conexión (desconexión o respuesta 421)"""
+        import smtplib
+        
+        if isinstance(error, smtplib.SMTPServerDisconnected):
+            return True
+        # Con 421 (p. ej. por inactividad) smtplib cierra el socket antes de lanzar la excepción
+        if isinstance(error, smtplib.SMTPResponseException):
+            return error.smtp_code == 421
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return any(code == 421 for code, _ in error.recipients.values())
+        return False
+    
+    @staticmethod
+    def _quit(server: 'smtplib.SMTP') -> None:
+        import smtplib
+        
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+    
+    def close(self) -> None:
+        """Cierra todas las conexiones SMTP persistentes abiertas"""
+        with self._servers_lock:
+            servers, self._idle_servers = self._idle_servers, []
+        
+        for server in servers:
+            self._quit(server)
     
     def send_article_email(self, email_content: Dict[str, str], 
                           article_metadata: Dict[str, Any]) -> bool:
@@ -30,50 +131,51 @@ class EmailSender:
             logger.info(f"Article URL: {article_metadata.get('url')}")
             return True
         
+        from email.utils import formataddr
+        
         try:
             # Crear mensaje
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = email_content['subject']
-            msg['From'] = formataddr((self.config.from_name, self.config.from_email))
-            msg['To'] = self.config.readwise_email
+            headers = _EMAIL_HEADERS_TEMPLATE.format(
+                from_=formataddr((self.config.from_name, self.config.from_email)),
+                to=self.config.readwise_email,
+                subject=_encode_header(email_content['subject']),
+                # Headers específicos para Readwise (si los tienen)
+                url=_encode_header(article_metadata.get('url', '')),
+                aid=_encode_header(str(article_metadata.get('id', '')))
+            )
             
-            # Añadir headers específicos para Readwise (si los tienen)
-            msg['X-Readwise-Source'] = 'eom-scraper'
-            msg['X-Article-URL'] = article_metadata.get('url', '')
-            msg['X-Article-ID'] = str(article_metadata.get('id', ''))
-            
-            # Crear contenido HTML
-            html_part = MIMEText(email_content['body'], 'html', 'utf-8')
-            msg.attach(html_part)
+            # Cuerpo HTML en base64 (líneas de 76 caracteres con CRLF)
+            body = base64.encodebytes(email_content['body'].encode('utf-8')).replace(b'\n', b'\r\n')
+            message = headers.encode('ascii') + body
             
             # Enviar email
-            return self._send_smtp_email(msg)
+            return self._send_smtp_email(message, email_content['subject'])
             
         except Exception as e:
             logger.error(f"Error creando email para artículo {article_metadata.get('id')}: {e}")
             return False
     
-    def _send_smtp_email(self, msg: MIMEMultipart) -> bool:
-        """Envía email via SMTP"""
+    def _send_smtp_email(self, message: bytes, subject: str) -> bool:
+        """Envía email via SMTP reutilizando la conexión abierta"""
+        import smtplib
+        
+        server = None
         try:
-            # Configurar servidor SMTP
-            if self.config.smtp_port == 465:
-                # SSL
-                server = smtplib.SMTP_SSL(self.config.smtp_server, self.config.smtp_port)
-            else:
-                # TLS
-                server = smtplib.SMTP(self.config.smtp_server, self.config.smtp_port)
-                server.starttls()
-            
-            # Autenticación
-            server.login(self.config.smtp_username, self.config.smtp_password)
-            
-            # Enviar
-            text = msg.as_string()
-            server.sendmail(self.config.from_email, self.config.readwise_email, text)
-            server.quit()
+            server = self._acquire_server()
+            try:
+                server.sendmail(self.config.from_email, self.config.readwise_email, message)
+            except smtplib.SMTPException as e:
+                if not self._connection_lost(e):
+                    raise
+                # La conexión reutilizada pudo caducar: reconectar una vez
+                logger.debug("Conexión SMTP cerrada por el servidor, reconectando")
+                self._quit(server)
+                server = None
+                server = self._connect()
+                server.sendmail(self.config.from_email, self.config.readwise_email, message)
             
-            logger.info(f"Email enviado exitosamente: {msg['Subject']}")
+            self._release_server(server)
+            logger.info(f"Email enviado exitosamente: {subject}")
             return True
             
         except smtplib.SMTPAuthenticationError:
@@ -81,29 +183,37 @@ class EmailSender:
             return False
         except smtplib.SMTPRecipientsRefused:
             logger.error(f"Email rechazado: {self.config.readwise_email}")
+            # La conexión sigue siendo válida
+            self._release_server(server)
             return False
         except smtplib.SMTPException as e:
             logger.error(f"Error SMTP: {e}")
+            if server is not None:
+                self._quit(server)
             return False
         except Exception as e:
             logger.error(f"Error inesperado enviando email: {e}")
+            if server is not None:
+                self._quit(server)
             return False
     
-    def test_connection(self) -> bool:
-        """Prueba la conexión SMTP"""
+    def test_connection(self, keep_open: bool = False) -> bool:
+        """
+        Prueba la conexión SMTP
+        
+        Con keep_open=True la conexión probada queda en el pool para el
+        primer envío, en lugar de cerrarse (hay que llamar a close()).
+        """
         if self.dry_run:
             logger.info("DRY RUN: Test de conexión SMTP simulado")
             return True
         
         try:
-            if self.config.smtp_port == 465:
-                server = smtplib.SMTP_SSL(self.config.smtp_server, self.config.smtp_port)
+            server = self._connect()
+            if keep_open:
+                self._release_server(server)
             else:
-                server = smtplib.SMTP(self.config.smtp_server, self.config.smtp_port)
-                server.starttls()
-            
-            server.login(self.config.smtp_username, self.config.smtp_password)
-            server.quit()
+                server.quit()
             
             logger.info("Conexión SMTP exitosa")
             return True
@@ -3,12 +3,15 @@
 EOM Scraper - Scraper automático para El Orden Mundial
 Extrae artículos y los envía a Readwise via email
 """
+import atexit
 import logging
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import replace
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 
 # Cargar variables de entorno
 from dotenv import load_dotenv
@@ -23,6 +26,12 @@ from core.content_processor import ContentProcessor
 from storage.state_manager import StateManager
 from delivery.email_sender import EmailSender
 
+# Cada cuántos envíos correctos se guarda el estado durante un lote
+_STATE_SAVE_INTERVAL = 8
+
+# Timeout máximo (segundos) de cada operación SMTP
+_SMTP_TIMEOUT = 60.0
+
 # Configurar logging
 def setup_logging(log_level: str = "INFO"):
     """Configura el sistema de logging"""
@@ -51,13 +60,25 @@ class EOMScraper:
         
         # Inicializar componentes
         self.api_client = EOMAPIClient(self.eom_config, self.app_config.request_delay)
+        atexit.register(self.api_client.close)
         self.content_processor = ContentProcessor()
         self.state_manager = StateManager(self.app_config.state_file)
-        self.email_sender = EmailSender(self.email_config, self.app_config.dry_run)
+        # El timeout SMTP nunca supera el tiempo máximo de ejecución: un envío colgado
+        # no puede retener el lote indefinidamente tras agotarse ese tiempo
+        self.email_sender = EmailSender(
+            self.email_config,
+            self.app_config.dry_run,
+            timeout=min(_SMTP_TIMEOUT, self.app_config.max_run_seconds)
+        )
         
         # Cargar estado
         self.state = self.state_manager.load_state()
         
+        # Los ETags de la API se persisten junto al estado, pero el cliente trabaja
+        # sobre una copia: un ETag nuevo solo pasa al estado cuando el lote termina
+        # bien (ver _persist_etags), aunque el estado se guarde a mitad de lote
+        self.api_client.etags = dict(self.state.etags)
+        
         self.logger = logging.getLogger(__name__)
     
     def run(self) -> bool:
@@ -65,8 +86,8 @@ class EOMScraper:
         self.logger.info("=== Iniciando EOM Scraper ===")
         
         try:
-            # Test de conexión SMTP
-            if not self.email_sender.test_connection():
+            # Test de conexión SMTP (la conexión se reutiliza para los envíos)
+            if not self.email_sender.test_connection(keep_open=True):
                 self.logger.error("Fallo en test de conexión email. Abortando.")
                 return False
             
@@ -74,23 +95,40 @@ class EOMScraper:
             if self.app_config.process_premium_content:
                 if not self.api_client.authenticate():
                     self.logger.warning("Fallo en autenticación. Solo se procesará contenido abierto.")
-                    self.app_config.process_premium_content = False
+                    self.app_config = replace(self.app_config, process_premium_content=False)
             
             # Obtener artículos nuevos
             new_articles = self._get_new_articles()
             
+            # Consulta fallida o incompleta: sin avanzar la fecha de búsqueda ni conservar
+            # ETags, la próxima ejecución la repite entera
+            if new_articles is None:
+                self.logger.error("No se pudo obtener la lista de posts. Abortando.")
+                self._persist_etags(complete=False)
+                self.state_manager.increment_error_count()
+                self.state_manager.save_state()
+                return False
+            
             if not new_articles:
                 self.logger.info("No hay artículos nuevos para procesar.")
+                self._persist_etags(complete=True)
                 self.state_manager.mark_successful_run()
                 self.state_manager.save_state()
                 return True
             
-            # Procesar y enviar artículos
-            processed_count = self._process_articles(new_articles)
+            # Procesar y enviar artículos dentro del tiempo máximo de ejecución
+            processed_count, deadline_reached = self._process_articles(new_articles)
+            
+            # Si algún artículo falló o quedó sin enviar, olvidar los ETags para volver
+            # a pedirlo en la próxima ejecución
+            self._persist_etags(complete=processed_count == len(new_articles))
             
             # Actualizar estado
             if processed_count > 0:
-                self.state_manager.update_last_check(datetime.now(timezone.utc))
+                # Si se agotó el tiempo quedan artículos sin enviar: no avanzar la fecha
+                # de búsqueda para recogerlos en la próxima ejecución
+                if not deadline_reached:
+                    self.state_manager.update_last_check(datetime.now(timezone.utc))
                 self.state_manager.mark_successful_run()
                 self.state_manager.cleanup_old_processed_ids()
             
@@ -101,22 +139,43 @@ class EOMScraper:
             
         except Exception as e:
             self.logger.error(f"Error crítico en scraper: {e}", exc_info=True)
+            self._persist_etags(complete=False)
             self.state_manager.increment_error_count()
             self.state_manager.save_state()
             return False
+        
+        finally:
+            self.email_sender.close()
     
-    def _get_new_articles(self) -> List[Dict[str, Any]]:
-        """Obtiene artículos nuevos desde la última verificación"""
+    def _persist_etags(self, complete: bool) -> None:
+        """Pasa los ETags del cliente al estado si la ejecución cubrió toda la consulta"""
+        if complete:
+            self.state.etags = dict(self.api_client.etags)
+        else:
+            self.api_client.etags.clear()
+            self.state.etags = {}
+    
+    def _get_new_articles(self) -> Optional[List[Dict[str, Any]]]:
+        """Obtiene artículos nuevos desde la última verificación (None si la consulta falla)"""
         last_check = self.state_manager.get_last_check_datetime()
         self.logger.info(f"Buscando artículos desde: {last_check}")
         
         # Obtener posts desde la API
         raw_posts = self.api_client.get_posts_since(last_check)
         
+        if raw_posts is None:
+            return None
+        
         if not raw_posts:
             return []
         
         # Convertir a metadata y filtrar ya procesados
+        # (referencias locales: el bucle puede recorrer cientos de posts)
+        process_open = self.app_config.process_open_content
+        process_premium = self.app_config.process_premium_content
+        is_processed = self.state_manager.is_post_processed
+        extract = self.api_client.extract_post_metadata
+        
         new_articles = []
         for post in raw_posts:
             post_id = post.get('id')
@@ -124,16 +183,18 @@ class EOMScraper:
             if not post_id:
                 continue
             
-            if self.state_manager.is_post_processed(post_id):
-                self.logger.debug(f"Post {post_id} ya procesado, saltando")
+            if is_processed(post_id):
+                self.logger.debug("Post %s ya procesado, saltando", post_id)
                 continue
             
             # Extraer metadata
-            metadata = self.api_client.extract_post_metadata(post)
+            metadata = extract(post)
             
-            # Filtrar por tipo de contenido si es necesario
-            if not self._should_process_article(metadata):
-                self.logger.debug(f"Post {post_id} filtrado por configuración")
+            # Filtrar por tipo de contenido según la configuración
+            access_type = metadata['access_type']
+            if not ((access_type == 'open' and process_open) or
+                    (access_type == 'premium' and process_premium)):
+                self.logger.debug("Post %s filtrado por configuración", post_id)
                 continue
             
             new_articles.append(metadata)
@@ -141,52 +202,83 @@ class EOMScraper:
         self.logger.info(f"Encontrados {len(new_articles)} artículos nuevos para procesar")
         return new_articles
     
-    def _should_process_article(self, metadata: Dict[str, Any]) -> bool:
-        """Determina si un artículo debe ser procesado según la configuración"""
-        access_type = metadata.get('access_type', 'unknown')
-        
-        if access_type == 'open' and self.app_config.process_open_content:
-            return True
-        
-        if access_type == 'premium' and self.app_config.process_premium_content:
-            return True
+    def _process_articles(self, articles: List[Dict[str, Any]]) -> Tuple[int, bool]:
+        """
+        Procesa y envía lista de artículos
         
-        return False
-    
-    def _process_articles(self, articles: List[Dict[str, Any]]) -> int:
-        """Procesa y envía lista de artículos"""
+        Al superar max_run_seconds se cancelan los envíos que aún no han empezado.
+        Devuelve (artículos enviados, si se cancelaron envíos por tiempo).
+        """
         processed_count = 0
+        deadline_reached = False
+        deadline = time.monotonic() + self.app_config.max_run_seconds
+        workers = max(1, self.app_config.email_workers)
         
-        for i, article_metadata in enumerate(articles, 1):
-            post_id = article_metadata['id']
-            title = article_metadata['title']
+        # Las conexiones SMTP se reutilizan durante todo el lote (una por envío en curso)
+        with self.email_sender, ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for i, article_metadata in enumerate(articles, 1):
+                # Los primeros envíos arrancan sin espera; el resto respeta el delay anti-spam
+                delay = self.app_config.send_delay if i > workers else 0
+                future = executor.submit(self._process_article, article_metadata, i, len(articles), delay)
+                futures[future] = article_metadata['id']
             
-            self.logger.info(f"Procesando artículo {i}/{len(articles)}: {title} (ID: {post_id})")
-            
-            try:
-                # Procesar contenido
-                processed_article = self.content_processor.process_article(article_metadata)
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
                 
-                # Crear email
-                email_content = self.content_processor.create_email_content(processed_article)
+                post_id = futures[future]
                 
-                # Enviar email
-                if self.email_sender.send_article_email(email_content, processed_article):
+                # El estado solo se modifica desde el hilo principal
+                if future.result():
                     self.state_manager.mark_post_processed(post_id)
                     processed_count += 1
                     self.logger.info(f"Artículo {post_id} enviado exitosamente")
-                else:
-                    self.logger.error(f"Error enviando artículo {post_id}")
-                
-                # Delay entre envíos para evitar spam
-                if i < len(articles):  # No delay después del último
-                    time.sleep(2)
+                    
+                    # Guardar el progreso periódicamente durante lotes grandes
+                    if processed_count % _STATE_SAVE_INTERVAL == 0:
+                        self.state_manager.save_state()
                 
-            except Exception as e:
-                self.logger.error(f"Error procesando artículo {post_id}: {e}", exc_info=True)
-                continue
+                if not deadline_reached and time.monotonic() > deadline:
+                    cancelled = sum(pending.cancel() for pending in futures)
+                    if cancelled:
+                        deadline_reached = True
+                        self.logger.warning(
+                            f"Tiempo máximo de ejecución agotado: {cancelled} artículos "
+                            f"pendientes para la próxima ejecución"
+                        )
+        
+        return processed_count, deadline_reached
+    
+    def _process_article(self, article_metadata: Dict[str, Any], index: int, total: int,
+                         delay: float) -> bool:
+        """Procesa y envía un artículo (se ejecuta en un hilo del pool)"""
+        post_id = article_metadata['id']
+        title = article_metadata['title']
+        
+        # Delay entre envíos de una misma conexión para evitar spam
+        if delay:
+            time.sleep(delay)
         
-        return processed_count
+        self.logger.info(f"Procesando artículo {index}/{total}: {title} (ID: {post_id})")
+        
+        try:
+            # Procesar contenido
+            processed_article = self.content_processor.process_article(article_metadata)
+            
+            # Crear email
+            email_content = self.content_processor.create_email_content(processed_article)
+            
+            # Enviar email
+            if self.email_sender.send_article_email(email_content, processed_article):
+                return True
+            
+            self.logger.error(f"Error enviando artículo {post_id}")
+            return False
+            
+        except Exception as e:
+            self.logger.error(f"Error procesando artículo {post_id}: {e}", exc_info=True)
+            return False
     
     def test_setup(self) -> bool:
         """Prueba la configuración del scraper"""
@@ -235,7 +327,8 @@ class EOMScraper:
     def send_test_email(self) -> bool:
         """Envía un email de prueba"""
         self.logger.info("Enviando email de prueba...")
-        return self.email_sender.send_test_email()
+        with self.email_sender:
+            return self.email_sender.send_test_email()
 
 def main():
     """Función principal"""
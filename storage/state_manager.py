@@ -1,60 +1,112 @@
 """
 Gestor de estado para tracking de artículos procesados
 """
+import os
 import json
+import heapq
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Dict, Set, Optional, Any
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field, fields
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+def _dumps(data: Dict[str, Any]) -> bytes:
+    """Serializa a JSON indentado en UTF-8 (orjson si está disponible)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+def _loads(raw: bytes) -> Any:
+    """Deserializa JSON (orjson si está disponible)"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _parse_timestamp(value: str) -> Optional[datetime]:
+    """Convierte un timestamp ISO en datetime (None si falta o es inválido)"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        logger.warning("Formato de timestamp inválido, usando datetime actual")
+        return None
+
 @dataclass
 class ScraperState:
     """Estado del scraper"""
     last_check_timestamp: str
-    processed_post_ids: Set[int]
+    # Los IDs van en su propio log: StateManager los completa bajo demanda
+    processed_post_ids: Set[int] = field(metadata={'persist': False})
     total_posts_processed: int
     last_successful_run: str
     errors_count: int
+    etags: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    # last_check_timestamp ya convertido a datetime (no se serializa)
+    _last_check_dt: Optional[datetime] = field(init=False, default=None, repr=False, compare=False,
+                                               metadata={'persist': False})
+    
+    def __post_init__(self) -> None:
+        self._last_check_dt = _parse_timestamp(self.last_check_timestamp)
+    
+    @property
+    def last_check_datetime(self) -> Optional[datetime]:
+        """Última verificación como datetime (None si falta o es inválida)"""
+        return self._last_check_dt
+    
+    def set_last_check(self, timestamp: datetime) -> None:
+        """Actualiza la última verificación manteniendo texto y datetime sincronizados"""
+        self.last_check_timestamp = timestamp.isoformat()
+        self._last_check_dt = timestamp
     
     def to_dict(self) -> Dict[str, Any]:
-        """Convierte a diccionario para serialización"""
+        """Convierte a diccionario para serialización (solo campos persistentes)"""
+        # Sin asdict: se serializa al momento, no hace falta copia profunda
         return {
-            'last_check_timestamp': self.last_check_timestamp,
-            'processed_post_ids': list(self.processed_post_ids),
-            'total_posts_processed': self.total_posts_processed,
-            'last_successful_run': self.last_successful_run,
-            'errors_count': self.errors_count
+            f.name: getattr(self, f.name)
+            for f in _PERSISTENT_FIELDS
         }
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'ScraperState':
         """Crea instancia desde diccionario"""
+        # processed_post_ids solo aparece en estados de versiones anteriores
         return cls(
             last_check_timestamp=data.get('last_check_timestamp', ''),
             processed_post_ids=set(data.get('processed_post_ids', [])),
             total_posts_processed=data.get('total_posts_processed', 0),
             last_successful_run=data.get('last_successful_run', ''),
-            errors_count=data.get('errors_count', 0)
+            errors_count=data.get('errors_count', 0),
+            etags=data.get('etags', {})
         )
 
+# Campos de ScraperState que se guardan en el archivo de estado
+_PERSISTENT_FIELDS = tuple(f for f in fields(ScraperState) if f.metadata.get('persist', True))
+
 class StateManager:
     """Gestor de estado persistente"""
     
     def __init__(self, state_file: str):
         self.state_file = Path(state_file)
+        # IDs procesados: un ID por línea, solo se añade al final y se compacta al limpiar
+        self.processed_file = self.state_file.with_name(f"{self.state_file.stem}_processed.log")
         self.state: Optional[ScraperState] = None
+        self._processed_loaded = False
     
     def load_state(self) -> ScraperState:
         """Carga el estado desde archivo o crea uno nuevo"""
         if self.state_file.exists():
             try:
-                with open(self.state_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                with open(self.state_file, 'rb') as f:
+                    data = _loads(f.read())
                 self.state = ScraperState.from_dict(data)
-                logger.info(f"Estado cargado: {len(self.state.processed_post_ids)} posts procesados")
             except (json.JSONDecodeError, KeyError) as e:
                 logger.warning(f"Error cargando estado: {e}. Creando estado nuevo.")
                 self.state = self._create_initial_state()
@@ -62,8 +114,58 @@ class StateManager:
             logger.info("No existe archivo de estado. Creando estado inicial.")
             self.state = self._create_initial_state()
         
+        # El log de IDs procesados se lee bajo demanda (ver _processed_ids):
+        # una ejecución sin posts nuevos no llega a cargarlo
+        self._processed_loaded = False
+        
+        # Migrar IDs guardados en el JSON por versiones anteriores al log
+        if self.state.processed_post_ids:
+            self._processed_ids()
+            self._compact_processed_log()
+        
+        logger.info(f"Estado cargado desde {self.state_file}")
         return self.state
     
+    def _processed_ids(self) -> Set[int]:
+        """IDs procesados, leyendo el log la primera vez que se necesitan"""
+        if not self._processed_loaded:
+            self.state.processed_post_ids |= self._load_processed_ids()
+            self._processed_loaded = True
+            logger.debug("%d posts procesados cargados", len(self.state.processed_post_ids))
+        return self.state.processed_post_ids
+    
+    def _load_processed_ids(self) -> Set[int]:
+        """Lee el log de IDs procesados"""
+        if not self.processed_file.exists():
+            return set()
+        
+        try:
+            with open(self.processed_file, 'r', encoding='utf-8') as f:
+                return {int(line) for line in f if line.strip().isdigit()}
+        except OSError as e:
+            logger.warning(f"Error leyendo {self.processed_file}: {e}")
+            return set()
+    
+    def _append_processed_id(self, post_id: int) -> None:
+        """Añade un ID al log de procesados"""
+        try:
+            self.processed_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.processed_file, 'a', encoding='utf-8') as f:
+                f.write(f"{post_id}\n")
+        except OSError as e:
+            logger.error(f"Error registrando post {post_id} como procesado: {e}")
+    
+    def _compact_processed_log(self) -> None:
+        """Reescribe el log con los IDs actuales de forma atómica"""
+        tmp_file = self.processed_file.with_suffix('.tmp')
+        try:
+            self.processed_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.writelines(f"{post_id}\n" for post_id in sorted(self.state.processed_post_ids))
+            os.replace(tmp_file, self.processed_file)
+        except OSError as e:
+            logger.error(f"Error compactando {self.processed_file}: {e}")
+    
     def save_state(self) -> bool:
         """Guarda el estado actual"""
         if not self.state:
@@ -74,10 +176,13 @@ class StateManager:
             # Crear directorio si no existe
             self.state_file.parent.mkdir(parents=True, exist_ok=True)
             
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(self.state.to_dict(), f, indent=2, ensure_ascii=False)
+            # Escritura atómica: un fallo a mitad no deja el archivo de estado corrupto
+            tmp_file = self.state_file.with_suffix('.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.write(_dumps(self.state.to_dict()))
+            os.replace(tmp_file, self.state_file)
             
-            logger.debug(f"Estado guardado en {self.state_file}")
+            logger.debug("Estado guardado en %s", self.state_file)
             return True
         except Exception as e:
             logger.error(f"Error guardando estado: {e}")
@@ -97,21 +202,26 @@ class StateManager:
     def update_last_check(self, timestamp: datetime) -> None:
         """Actualiza timestamp de última verificación"""
         if self.state:
-            self.state.last_check_timestamp = timestamp.isoformat()
-            logger.debug(f"Timestamp actualizado: {self.state.last_check_timestamp}")
+            self.state.set_last_check(timestamp)
+            logger.debug("Timestamp actualizado: %s", self.state.last_check_timestamp)
     
     def mark_post_processed(self, post_id: int) -> None:
         """Marca un post como procesado"""
         if self.state:
-            if post_id not in self.state.processed_post_ids:
-                self.state.processed_post_ids.add(post_id)
+            processed_ids = self._processed_ids()
+            
+            # set.add es idempotente: el cambio de tamaño indica si el ID era nuevo
+            previous_count = len(processed_ids)
+            processed_ids.add(post_id)
+            if len(processed_ids) != previous_count:
                 self.state.total_posts_processed += 1
-                logger.debug(f"Post {post_id} marcado como procesado")
+                self._append_processed_id(post_id)
+                logger.debug("Post %s marcado como procesado", post_id)
     
     def is_post_processed(self, post_id: int) -> bool:
         """Verifica si un post ya fue procesado"""
         if self.state:
-            return post_id in self.state.processed_post_ids
+            return post_id in self._processed_ids()
         return False
     
     def mark_successful_run(self) -> None:
@@ -127,22 +237,19 @@ class StateManager:
     
     def get_last_check_datetime(self) -> datetime:
         """Obtiene la fecha de última verificación como datetime"""
-        if self.state and self.state.last_check_timestamp:
-            try:
-                return datetime.fromisoformat(self.state.last_check_timestamp.replace('Z', '+00:00'))
-            except ValueError:
-                logger.warning("Formato de timestamp inválido, usando datetime actual")
+        if self.state and self.state.last_check_datetime is not None:
+            return self.state.last_check_datetime
         
-        # Si no hay timestamp válido, usar hace 1 hora
-        from datetime import timedelta
+        # Si no hay timestamp válido, usar hace 1 hora. No es el caso de la primera
+        # ejecución: el estado inicial ya guarda el momento de su creación
         return datetime.now(timezone.utc) - timedelta(hours=1)
     
     def cleanup_old_processed_ids(self, keep_recent: int = 1000) -> None:
         """Limpia IDs de posts procesados antiguos para evitar crecimiento excesivo"""
-        if self.state and len(self.state.processed_post_ids) > keep_recent * 1.5:
+        if self.state and len(self._processed_ids()) > keep_recent * 1.5:
             # Mantener solo los más recientes (asumiendo que IDs mayores = más recientes)
-            sorted_ids = sorted(self.state.processed_post_ids, reverse=True)
-            self.state.processed_post_ids = set(sorted_ids[:keep_recent])
+            self.state.processed_post_ids = set(heapq.nlargest(keep_recent, self.state.processed_post_ids))
+            self._compact_processed_log()
             logger.info(f"Limpieza de estado: mantenidos {keep_recent} posts recientes")
     
     def get_stats(self) -> Dict[str, Any]:
@@ -152,7 +259,7 @@ class StateManager:
         
         return {
             'total_processed': self.state.total_posts_processed,
-            'unique_posts_tracked': len(self.state.processed_post_ids),
+            'unique_posts_tracked': len(self._processed_ids()),
             'last_check': self.state.last_check_timestamp,
             'last_successful_run': self.state.last_successful_run,
             'errors_count': self.state.errors_count
@@ -3,12 +3,85 @@ Funciones auxiliares y utilidades generales
 """
 import re
 import logging
+from html import unescape
 from datetime import datetime, timezone
 from typing import Optional
 from urllib.parse import urlparse
 
+try:
+    import lxml  # noqa: F401
+    SOUP_PARSER = 'lxml'
+except ImportError:
+    SOUP_PARSER = 'html.parser'
+
 logger = logging.getLogger(__name__)
 
+# Clase del div que MemberPress usa para el excerpt de contenido premium
+PREMIUM_MARKER = 'mepr-unauthorized-excerpt'
+
+# Patrones compilados una sola vez
+_FILENAME_INVALID_RE = re.compile(r'[<>:"/\\|?*]')
+_WHITESPACE_RE = re.compile(r'\s+')
+_FILENAME_OTHER_RE = re.compile(r'[^\w\-_.]')
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+# Etiqueta HTML; los valores de atributo entre comillas pueden contener '>'
+_TAG_RE = re.compile(r'</?[A-Za-z!?](?:[^>"\']|"[^"]*"|\'[^\']*\')*>')
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+# Un <script>/<style> sin cierre se extiende hasta el final, como en html.parser
+_SCRIPT_STYLE_RE = re.compile(r'<(script|style)\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*>.*?(?:</\1\s*>|\Z)',
+                              re.DOTALL | re.IGNORECASE)
+# Netloc de una URL http(s) simple (sin espacios ni IPv6 entre corchetes)
+_HTTP_NETLOC_RE = re.compile(r'https?://([^/?#\s\[\]]*)(?:[/?#]|$)')
+
+# Propiedades CSS seguras para clientes de email
+_EMAIL_SAFE_STYLE_PROPS = ('color', 'font-size', 'text-align', 'margin', 'padding')
+
+# BeautifulSoup se importa la primera vez que se necesita y queda cacheado aquí
+_BeautifulSoup = None
+
+def get_beautifulsoup():
+    """Devuelve la clase BeautifulSoup, importándola solo en la primera llamada"""
+    global _BeautifulSoup
+    if _BeautifulSoup is None:
+        from bs4 import BeautifulSoup
+        _BeautifulSoup = BeautifulSoup
+    return _BeautifulSoup
+
+def soup_fragment_html(soup) -> str:
+    """
+    Serializa un fragmento HTML parseado sin los envoltorios que añade lxml
+    
+    lxml envuelve los fragmentos en <html><head>/<body> y mueve a <head> los
+    elementos iniciales como <style>, <meta>, <link> o <title>; aquí se
+    conservan igual que con html.parser.
+    
+    Args:
+        soup: Árbol de BeautifulSoup
+    
+    Returns:
+        HTML del fragmento
+    """
+    html = soup.html
+    if html is None:
+        return str(soup)
+    
+    parts = []
+    for node in soup.contents:
+        if node is not html:
+            # Comentarios u otros nodos fuera de <html>
+            parts.append(_node_html(node))
+            continue
+        for child in html.contents:
+            if child.name in ('head', 'body'):
+                parts.append(child.decode_contents())
+            else:
+                parts.append(_node_html(child))
+    return ''.join(parts)
+
+def _node_html(node) -> str:
+    """HTML de un nodo: los textos y comentarios (name None) con su formato de salida"""
+    return node.output_ready() if node.name is None else node.decode()
+
 def format_datetime(dt_str: str, output_format: str = "%d/%m/%Y %H:%M") -> str:
     """
     Formatea una fecha de WordPress a formato legible
@@ -51,11 +124,11 @@ def clean_filename(filename: str, max_length: int = 100) -> str:
         return "untitled"
     
     # Remover caracteres no válidos
-    cleaned = re.sub(r'[<>:"/\\|?*]', '_', filename)
+    cleaned = _FILENAME_INVALID_RE.sub('_', filename)
     
     # Remover espacios múltiples y caracteres especiales
-    cleaned = re.sub(r'\s+', '_', cleaned)
-    cleaned = re.sub(r'[^\w\-_.]', '', cleaned)
+    cleaned = _WHITESPACE_RE.sub('_', cleaned)
+    cleaned = _FILENAME_OTHER_RE.sub('', cleaned)
     
     # Truncar si es muy largo
     if len(cleaned) > max_length:
@@ -80,6 +153,11 @@ def extract_domain(url: str) -> Optional[str]:
     if not url:
         return None
     
+    # Caso habitual (enlaces de artículos): evitar el coste de urlparse
+    match = _HTTP_NETLOC_RE.match(url)
+    if match:
+        return match.group(1)
+    
     try:
         parsed = urlparse(url)
         return parsed.netloc
@@ -118,14 +196,13 @@ def extract_reading_time_from_content(html_content: str, wpm: int = 200) -> int:
     Returns:
         Tiempo estimado en minutos
     """
-    from bs4 import BeautifulSoup
-    
     if not html_content:
         return 1
     
-    # Extraer texto limpio
-    soup = BeautifulSoup(html_content, 'html.parser')
-    text = soup.get_text(separator=' ', strip=True)
+    # Extraer texto limpio: basta con quitar etiquetas, no hace falta construir el árbol
+    text = _COMMENT_RE.sub(' ', html_content)
+    text = _SCRIPT_STYLE_RE.sub(' ', text)
+    text = unescape(_TAG_RE.sub(' ', text))
     
     # Contar palabras
     word_count = len(text.split())
@@ -148,8 +225,7 @@ def is_valid_email(email: str) -> bool:
     if not email:
         return False
     
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+    return bool(_EMAIL_RE.match(email))
 
 def sanitize_html_for_email(html_content: str) -> str:
     """
@@ -161,12 +237,10 @@ def sanitize_html_for_email(html_content: str) -> str:
     Returns:
         HTML sanitizado
     """
-    from bs4 import BeautifulSoup
-    
     if not html_content:
         return ""
     
-    soup = BeautifulSoup(html_content, 'html.parser')
+    soup = get_beautifulsoup()(html_content, SOUP_PARSER)
     
     # Remover elementos problemáticos en emails
     for element in soup.find_all(['script', 'style', 'meta', 'link']):
@@ -179,7 +253,7 @@ def sanitize_html_for_email(html_content: str) -> str:
         safe_styles = []
         
         for style_rule in style.split(';'):
-            if any(prop in style_rule.lower() for prop in ['color', 'font-size', 'text-align', 'margin', 'padding']):
+            if any(prop in style_rule.lower() for prop in _EMAIL_SAFE_STYLE_PROPS):
                 safe_styles.append(style_rule.strip())
         
         if safe_styles:
@@ -187,7 +261,7 @@ def sanitize_html_for_email(html_content: str) -> str:
         else:
             del element['style']
     
-    return str(soup)
+    return soup_fragment_html(soup)
 
 def get_current_timestamp() -> str:
     """